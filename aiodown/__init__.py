@@ -26,6 +26,6 @@ __license__ = "MIT"
 __version__ = "1.0.7"
 
 from . import errors, types
-from .client import Client
+from .client import Client, download_many
 
-__all__ = ["errors", "types", "Client"]
+__all__ = ["errors", "types", "Client", "download_many"]
@@ -20,9 +20,20 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from typing import List, Union
+import asyncio
+import os
+import warnings
+from typing import AsyncIterator, Iterable, Tuple
+
+import httpx
 
 from aiodown.types import Download
+from aiodown.types.download import _make_httpx
+
+_IN_PROGRESS_MESSAGE = (
+    "There are some downloads in progress, cancel them first or wait for them to finish"
+)
+_REM_FALSE_MESSAGE = "You can only use 'client.rem(id)' and not 'client.rem(False)'"
 
 
 class Client:
@@ -32,21 +43,111 @@ class Client:
         workers (``int``, *optional*):
             Number of workers for each download
             Default to 8.
+
+        max_downloads (``int``, *optional*):
+            Maximum number of downloads transferring at the same time,
+            the others wait for a free slot.
+            Default to 8.
+
+        buffer_size (``int``, *optional*):
+            Number of bytes buffered in memory before being written to the file.
+            Default to 1048576 (1 MiB).
+
+        direct_io (``bool``, *optional*):
+            If True, files are written with ``O_DIRECT`` where supported,
+            bypassing the page cache. Useful for large downloads.
+            Default to False.
+
+        low_speed_limit (``int``, *optional*):
+            Minimum average speed in bytes per second, a download that stays below it
+            for ``low_speed_time`` seconds is reconnected. 0 disables the check.
+            Default to 0.
+
+        low_speed_time (``float``, *optional*):
+            Number of seconds the speed may stay below ``low_speed_limit``.
+            Default to 30.
+
+        io_backend (``str``, *optional*):
+            How the files are written, "stdlib" or "caio". "caio" submits the writes
+            to the kernel's asynchronous I/O (io_uring or Linux AIO), which can help
+            on slow disks, it requires the ``caio`` extra.
+            Default to "stdlib".
+
+        httpx_client (:obj:`httpx.AsyncClient`, *optional*):
+            The httpx client used by the downloads, it is not closed by the client.
+            Files are not split in byte ranges over its HTTP/2 connections.
+            By default one tuned for downloads is created when entering ``async with``.
     """
 
-    def __init__(self, workers: int = 8):
+    __slots__ = (
+        "_workers",
+        "_max_downloads",
+        "_buffer_size",
+        "_direct_io",
+        "_low_speed_limit",
+        "_low_speed_time",
+        "_io_backend",
+        "_semaphore",
+        "_semaphore_loop",
+        "_running",
+        "_active",
+        "_downloads",
+        "_next_id",
+        "_httpx",
+        "_httpx_ranges",
+        "_httpx_client",
+    )
+
+    def __init__(
+        self,
+        workers: int = 8,
+        max_downloads: int = 8,
+        buffer_size: int = Download.BUFFER_SIZE,
+        direct_io: bool = False,
+        low_speed_limit: int = 0,
+        low_speed_time: float = 30.0,
+        io_backend: str = "stdlib",
+        httpx_client: httpx.AsyncClient = None,
+    ):
         self._workers = workers
+        self._max_downloads = max_downloads
+        self._buffer_size = buffer_size
+        self._direct_io = direct_io
+        self._low_speed_limit = low_speed_limit
+        self._low_speed_time = low_speed_time
+        self._io_backend = io_backend
+        self._semaphore = None
+        self._semaphore_loop = None
         self._running = False
+        self._active = 0
         self._downloads = {}
+        self._next_id = 0
+        self._httpx = httpx_client
+        self._httpx_ranges = httpx_client
+        self._httpx_client = httpx_client
 
     async def __aenter__(self):
+        if self._httpx_client is None:
+            # Every running download may have all of its workers connected.
+            max_connections = max(100, self._workers * self._max_downloads)
+            self._httpx = _make_httpx(max_connections)
+            self._httpx_ranges = _make_httpx(max_connections, http2=False)
         return self
 
     async def __aexit__(self, *args):
+        if self._httpx_client is None and self._httpx is not None:
+            await self._httpx.aclose()
+            await self._httpx_ranges.aclose()
+            self._httpx = self._httpx_ranges = None
         return None
 
     def add(
-        self, url: str, path: str = None, retries: int = 3, workers: int = None
+        self,
+        url: str,
+        path: str = None,
+        retries: int = 3,
+        workers: int = None,
+        chunk_size: int = Download.CHUNK_SIZE,
     ) -> Download:
         """Adds a file to the download list.
 
@@ -64,29 +165,44 @@ class Client:
                 Number of workers for each download.
                 Default to 8.
 
+            chunk_size (``int``, *optional*):
+                Number of bytes read from a compressed response at once,
+                uncompressed data is written as it is received.
+                Default to 65536 (64 KiB).
+
         Returns:
             :obj:`aiodown.types.Download`: The download object.
         """
 
         if self.is_running():
-            raise RuntimeError(
-                "There are some downloads in progress, cancel them first or wait for them to finish"
-            )
-
-        dl_id = len(self._downloads.keys())
-        dl = Download(url, path, retries, self, workers or self._workers)
-        dl._id = dl_id
-        self._downloads[dl_id] = dl
+            raise RuntimeError(_IN_PROGRESS_MESSAGE)
+
+        dl = Download(
+            url,
+            path,
+            retries,
+            self,
+            workers or self._workers,
+            chunk_size,
+            self._buffer_size,
+            self._direct_io,
+            self._low_speed_limit,
+            self._low_speed_time,
+            self._io_backend,
+        )
+        dl._id = self._next_id
+        self._downloads[dl._id] = dl
+        self._next_id += 1
 
         return dl
 
-    def rem(self, dl_id: Union[bool, int]):
-        """Removes one or all files from the download list.
+    def rem(self, dl_id: int):
+        """Removes a file from the download list.
 
         Parameters:
-            dl_id (``int``, ``True``):
-                Removes the download from the list with the specified id,
-                if True removes all downloads from the list.
+            dl_id (``int``):
+                Removes the download from the list with the specified id.
+                Passing True is deprecated, use :meth:`clear` instead.
 
         Raises:
             KeyError: In case the dl_id is invalid.
@@ -96,23 +212,32 @@ class Client:
 
         if isinstance(dl_id, bool):
             if not dl_id:
-                raise TypeError(
-                    "You can only use 'client.rem(True)' or 'client.rem(id)' and not 'client.rem(False)'"
-                )
-            if self.is_running():
-                raise RuntimeError(
-                    "There are some downloads in progress, cancel them first or wait for them to finish"
-                )
-            else:
-                self._downloads = {}
-        else:
-            if dl_id not in self._downloads.keys():
-                raise KeyError(f"There is no download with id '{dl_id}'")
-
-            if self._downloads[dl_id].is_finished():
-                del self._downloads[dl_id]
-            else:
-                raise RuntimeError("The download is in progress, cancel it first")
+                raise TypeError(_REM_FALSE_MESSAGE)
+            warnings.warn(
+                "'client.rem(True)' is deprecated, use 'client.clear()' instead",
+                DeprecationWarning,
+                stacklevel=2,
+            )
+            return self.clear()
+
+        if dl_id not in self._downloads:
+            raise KeyError(f"There is no download with id '{dl_id}'")
+
+        if self._downloads[dl_id]._is_running():
+            raise RuntimeError("The download is in progress, cancel it first")
+        del self._downloads[dl_id]
+
+    def clear(self):
+        """Removes all files from the download list.
+
+        Raises:
+            RuntimeError: In case of have a download in progress.
+        """
+
+        if self.is_running():
+            raise RuntimeError(_IN_PROGRESS_MESSAGE)
+
+        self._downloads.clear()
 
     async def start(self):
         """Starts all downloads in the list.
@@ -123,10 +248,26 @@ class Client:
         if self.is_running():
             raise RuntimeError("Downloads have already started")
 
-        for _download in self._downloads.values():
-            await _download.start()
+        # Each download counts itself as active when it starts.
+        await asyncio.gather(
+            *[_download.start() for _download in self._downloads.values()]
+        )
+        self._running = self._active > 0
 
-        self._running = True
+    async def iter_completed(self) -> AsyncIterator[Download]:
+        """Yields the downloads in the list as soon as each one is finished.
+
+        Use it after :meth:`start`, the downloads are yielded in the order
+        they finish, failed and stopped downloads included.
+
+        Returns:
+            Async iterator of :obj:`aiodown.types.Download`: The finished download objects.
+        """
+
+        for future in asyncio.as_completed(
+            [_download.wait() for _download in self._downloads.values()]
+        ):
+            yield await future
 
     async def stop(self):
         """Stop all downloads in the list.
@@ -137,21 +278,51 @@ class Client:
         if not self.is_running():
             raise RuntimeError("There is no download in progress")
 
-        for _download in self._downloads.values():
-            await _download.stop()
+        await asyncio.gather(
+            *[
+                _download.stop()
+                for _download in self._downloads.values()
+                if _download._is_running()
+            ]
+        )
 
         self._running = False
 
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Get the semaphore that bounds concurrent downloads.
+
+        It is created lazily because there may be no event loop when the client is created,
+        and again for each event loop the client is used from, it can not be shared.
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self._max_downloads)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _notify_started(self):
+        """Called by a download when it starts, also when it is started again."""
+
+        self._active += 1
+        self._running = True
+
+    def _notify_finished(self):
+        """Called by a download when it finishes, stops or fails."""
+
+        self._active -= 1
+        if self._active <= 0:
+            # Reconcile with the downloads before the client stops running.
+            self.check_is_running()
+
     def check_is_running(self):
         """Checks if a download is still in progress."""
 
-        for _download in self._downloads.values():
-            if _download.is_finished():
-                continue
-            else:
-                return
-
-        self._running = False
+        self._active = sum(
+            _download._is_running() for _download in self._downloads.values()
+        )
+        if self._active == 0:
+            self._running = False
 
     def is_running(self) -> bool:
         """Checks whether the client is running.
@@ -162,11 +333,65 @@ class Client:
 
         return self._running
 
-    def get_downloads(self) -> List[Download]:
+    @staticmethod
+    def install_uvloop() -> bool:
+        """Sets uvloop as the event loop policy, if it is installed.
+
+        uvloop makes the network I/O of the downloads faster than the default
+        asyncio event loop, call it before the event loop is created.
+
+        Returns:
+            ``bool``: True if uvloop was set, False if it is not installed.
+        """
+
+        try:
+            import uvloop
+        except ImportError:
+            return False
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return True
+
+    def get_downloads(self) -> Tuple[Download, ...]:
         """Get the list of downloads.
 
         Returns:
-            List of :obj:`aiodown.types.Download`: List of download objects.
+            Tuple of :obj:`aiodown.types.Download`: Snapshot of the download objects.
         """
 
-        return self._downloads.values()
+        return tuple(self._downloads.values())
+
+
+async def download_many(
+    urls: Iterable[str], path: str = None, max_downloads: int = 8, **kwargs
+) -> Tuple[Download, ...]:
+    """Downloads many files with a single client, waiting until all are finished.
+
+    Parameters:
+        urls (Iterable of ``str``):
+            Direct file links.
+
+        path (``str``, *optional*):
+            Directory where the files are saved, each one named after its link.
+
+        max_downloads (``int``, *optional*):
+            Maximum number of downloads transferring at the same time.
+            Default to 8.
+
+        **kwargs (*optional*):
+            Other parameters of :obj:`aiodown.Client`.
+
+    Returns:
+        Tuple of :obj:`aiodown.types.Download`: The finished download objects,
+        in the order of the links.
+    """
+
+    async with Client(max_downloads=max_downloads, **kwargs) as client:
+        for url in urls:
+            client.add(url, os.path.join(path, os.path.basename(url)) if path else None)
+        await client.start()
+        return tuple(
+            await asyncio.gather(
+                *[_download.wait() for _download in client.get_downloads()]
+            )
+        )
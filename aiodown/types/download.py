@@ -21,25 +21,459 @@
 # SOFTWARE.
 
 import asyncio
-import concurrent.futures
+import contextlib
 import datetime
+import functools
+import importlib.util
+import ipaddress
+import itertools
 import logging
+import mmap
 import os
-import random
-from typing import Callable, Union
+import socket
+import time
+import urllib.request
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
 
-import async_files
 import httpcore
 import httpx
-import humanize
 
 import aiodown
 from aiodown.errors import FinishedError, PausedError, ProgressError
 
 log = logging.getLogger(__name__)
 
+# Ids of the downloads created without a client, which numbers its own.
+_ids = itertools.count(1)
+
+# The writes of the "caio" I/O backend in flight at once, per download.
+_AIO_REQUESTS = 64
+_IO_BACKENDS = ("stdlib", "caio")
+
+
+class _Status:
+    READY = 0
+    STARTED = 1
+    DOWNLOADING = 2
+    PAUSED = 3
+    STOPPED = 4
+    RECONNECTING = 5
+    FINISHED = 6
+    FAILED = 7
+
+
+_STATUS_NAMES = (
+    "ready",
+    "started",
+    "downloading",
+    "paused",
+    "stopped",
+    "reconnecting",
+    "finished",
+    "failed",
+)
+
+# Statuses in which the download has ended, successfully or not.
+_FINISHED_STATUSES = frozenset((_Status.FAILED, _Status.FINISHED, _Status.STOPPED))
+
+_BLOCK_SIZE = 4096
+_MIN_RANGE_SIZE = 1048576
+
+# Fail fast on connections that stay open but no longer transfer any data.
+_TIMEOUT = httpx.Timeout(connect=10.0, read=30.0, write=10.0, pool=None)
+_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)] + [
+    (socket.IPPROTO_TCP, getattr(socket, name), value)
+    for name, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3))
+    if hasattr(socket, name)
+]
+
+
+class _LowSpeedError(Exception):
+    """Raised when a transfer stays below the low speed limit for too long."""
+
+
+class _ChangedError(Exception):
+    """Raised when the file changed on the server since the download started."""
+
+
+class _SpeedCheck:
+    """Tracks the transfer speed of a response, like curl's ``CURLOPT_LOW_SPEED_LIMIT``
+    and ``CURLOPT_LOW_SPEED_TIME``."""
+
+    __slots__ = ("_limit", "_period", "_since", "_bytes")
+
+    def __init__(self, limit: int, period: float):
+        self._limit = limit
+        self._period = period
+        self.reset()
+
+    def reset(self):
+        """Starts a new measuring window, used after the download is resumed."""
+
+        self._since = time.monotonic()
+        self._bytes = 0
+
+    def update(self, size: int):
+        """Accounts the received bytes.
+
+        Raises:
+            _LowSpeedError: If the average speed of the last window is below the limit.
+        """
+
+        if not self._limit:
+            return
+
+        self._bytes += size
+        elapsed = time.monotonic() - self._since
+        if elapsed >= self._period:
+            if self._bytes / elapsed < self._limit:
+                raise _LowSpeedError(
+                    f"Transfer speed below {self._limit} bytes/s for {self._period} seconds"
+                )
+            self.reset()
+
+
+@functools.lru_cache(maxsize=1024)
+def _naturalsize(value: Union[int, float], binary: bool, gnu: bool) -> str:
+    """Cached ``humanize.naturalsize``, progress bars format the same sizes many
+    times per second."""
+
+    import humanize
+
+    return humanize.naturalsize(value, binary=binary, gnu=gnu)
+
+
+def _make_transport(
+    max_connections: int, http2: bool, proxy: Optional[str] = None
+) -> httpx.AsyncHTTPTransport:
+    return httpx.AsyncHTTPTransport(
+        http2=http2,
+        retries=0,
+        socket_options=_SOCKET_OPTIONS,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=64,
+            keepalive_expiry=60.0,
+        ),
+        proxy=httpx.Proxy(proxy) if proxy else None,
+    )
+
+
+def _get_proxies() -> Dict[str, Optional[str]]:
+    """Get the proxies set up by the environment, as httpx mount patterns.
+
+    httpx ignores them once a transport is given, this reads them the same way
+    from the standard library. The hosts of ``NO_PROXY`` map to None.
+    """
+
+    proxies = urllib.request.getproxies()
+    mounts = {}
+    for scheme in ("http", "https", "all"):
+        url = proxies.get(scheme)
+        if url:
+            mounts[f"{scheme}://"] = url if "://" in url else f"http://{url}"
+
+    for host in proxies.get("no", "").split(","):
+        host = host.strip()
+        if host == "*":
+            return {}
+        if not host:
+            continue
+        if "://" in host:
+            mounts[host] = None
+            continue
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            # Domains also match their subdomains, except localhost.
+            pattern = host if host.lower() == "localhost" else f"*{host}"
+        else:
+            pattern = f"[{host}]" if address.version == 6 else host
+        mounts[f"all://{pattern}"] = None
+    return mounts
+
+
+def _make_httpx(max_connections: int = 100, http2: bool = True) -> httpx.AsyncClient:
+    """Creates an httpx client tuned for downloads.
+
+    HTTP/2 carries the requests of the downloads over few connections. The byte
+    ranges of a file use a client without it, since HTTP/2 would multiplex them
+    over a single connection, and each range needs its own to add throughput.
+    """
+
+    # httpx ignores the proxy environment variables once a transport is given,
+    # so the proxies they set up are mounted here, like httpx itself does.
+    mounts = {
+        pattern: _make_transport(max_connections, http2, proxy) if proxy else None
+        for pattern, proxy in _get_proxies().items()
+    }
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=_TIMEOUT,
+        transport=_make_transport(max_connections, http2),
+        mounts=mounts,
+    )
+
+
+def _get_validator(headers: httpx.Headers) -> Optional[str]:
+    """Get the ``If-Range`` value that identifies this version of the file, if any.
+
+    Weak ETags can not be used in ``If-Range``, the date of the last modification is
+    used instead.
+    """
+
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _prepare_path(directory: str, name: str) -> str:
+    """Creates the download directory if needed.
+
+    Returns:
+        ``str``: The path of the file.
+
+    Raises:
+        FileExistsError: In case the file already exists.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        raise FileExistsError(f"[Errno 17] File exists: '{path}'")
+    return path
+
+
+def _open_file(
+    path: str, direct_io: bool = False, exclusive: bool = True, truncate: bool = False
+) -> Tuple[int, bool]:
+    """Opens the file for writing, with ``O_DIRECT`` if requested and supported.
+
+    Parameters:
+        exclusive (``bool``, *optional*):
+            If True, the file is created and must not exist yet,
+            otherwise the existing file is opened to be resumed.
+
+        truncate (``bool``, *optional*):
+            If True, the existing file is emptied to start over.
+
+    Returns:
+        ``tuple``: The file descriptor and whether ``O_DIRECT`` is in use.
+
+    Raises:
+        FileExistsError: In case the file is exclusive and already exists.
+    """
+
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    if exclusive:
+        flags |= os.O_EXCL
+    elif truncate:
+        flags |= os.O_TRUNC
+    if direct_io and hasattr(os, "O_DIRECT"):
+        try:
+            return os.open(path, flags | os.O_DIRECT, 0o644), True
+        except FileExistsError:
+            raise
+        except OSError:
+            # Some filesystems do not support O_DIRECT, fall back to the page cache.
+            # The failed attempt may have already created the file.
+            flags &= ~os.O_EXCL
+    return os.open(path, flags, 0o644), False
+
+
+def _preallocate(fd: int, size: int):
+    """Reserves the space of the whole file at once where supported, so that it is
+    not fragmented by the writes. Already allocated blocks are left untouched.
+
+    Filesystems without ``fallocate`` make the C library write every block instead,
+    which may take seconds on large files, so it is called from the default executor.
+    """
+
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            # Not supported by the filesystem, the blocks are allocated as written.
+            pass
+
+
+def _close_file(fd: int, sync: bool = False):
+    """Closes the file, syncing it to the disk first if requested, so that a complete
+    file is never renamed in place before its data is stored."""
+
+    try:
+        if sync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_at(fd: int, data: memoryview, offset: int):
+    while data:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, data, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, data)
+        data = data[written:]
+        offset += written
+
+
+async def _run_in_executor(func: Callable, *args):
+    """Runs a blocking call on the file in the default executor.
+
+    If the caller is cancelled, the call is still waited for, since it keeps
+    using the file and the buffers given to it.
+    """
+
+    future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+@contextlib.asynccontextmanager
+async def _send(client: httpx.AsyncClient, request: httpx.Request):
+    """Like ``client.stream()``, but sends a request that has already been built."""
+
+    response = await client.send(request, stream=True)
+    try:
+        yield response
+    finally:
+        await response.aclose()
+
+
+async def _aio_write(context: "caio.AsyncioContext", fd: int, data: bytes, offset: int):
+    """Writes all the data at the offset, the kernel may write only part of it at once."""
+
+    while data:
+        written = await context.write(data, fd, offset)
+        data = data[written:]
+        offset += written
+
+
+class _FileWriter:
+    """Writes to a file from the given offset through a buffer allocated once and reused.
+
+    Full buffers are copied into the page cache directly, which takes microseconds,
+    a round trip through the executor would cost more than the write itself.
+    With ``aio`` they are submitted to the kernel's asynchronous I/O instead.
+
+    With ``direct_io`` the buffer is page-aligned and only whole blocks are written,
+    from the default executor since they wait for the disk, the caller truncates
+    the padding of the last block once the file is complete.
+    """
+
+    __slots__ = ("_fd", "_aio", "_offset", "_direct_io", "_buffer", "_view", "_used")
+
+    def __init__(
+        self,
+        fd: int,
+        offset: int,
+        buffer_size: int,
+        direct_io: bool = False,
+        aio: "caio.AsyncioContext" = None,
+    ):
+        self._fd = fd
+        self._aio = aio
+        self._offset = offset
+        self._direct_io = direct_io
+        size = -(-max(buffer_size, _BLOCK_SIZE) // _BLOCK_SIZE) * _BLOCK_SIZE
+        self._buffer = mmap.mmap(-1, size) if direct_io else bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._used = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        try:
+            await self._flush()
+        finally:
+            self._view.release()
+            if self._direct_io:
+                self._buffer.close()
+
+    def tell(self) -> int:
+        """Get the offset up to which the data has been written to the file."""
+
+        return self._offset
+
+    async def write(self, chunk: bytes):
+        chunk = memoryview(chunk)
+        while chunk:
+            size = min(len(chunk), len(self._view) - self._used)
+            self._view[self._used : self._used + size] = chunk[:size]
+            self._used += size
+            chunk = chunk[size:]
+            if self._used == len(self._view):
+                await self._flush()
+
+    async def _flush(self):
+        if not self._used:
+            return
+
+        length = self._used
+        if self._direct_io:
+            # O_DIRECT only writes whole blocks, pad the tail with zeros.
+            length = -(-length // _BLOCK_SIZE) * _BLOCK_SIZE
+            self._view[self._used : length] = bytes(length - self._used)
+
+            with self._view[:length] as data:
+                await _run_in_executor(_write_at, self._fd, data, self._offset)
+        elif self._aio is not None:
+            await _aio_write(
+                self._aio, self._fd, bytes(self._view[:length]), self._offset
+            )
+        else:
+            _write_at(self._fd, self._view[:length], self._offset)
+        self._offset += self._used
+        self._used = 0
+
 
 class Download:
+    CHUNK_SIZE = 65536
+    BUFFER_SIZE = 1048576
+
+    __slots__ = (
+        "_client",
+        "_workers",
+        "_chunk_size",
+        "_buffer_size",
+        "_direct_io",
+        "_low_speed_limit",
+        "_low_speed_time",
+        "_io_backend",
+        "_httpx_client",
+        "_id",
+        "_url",
+        "_path",
+        "_name",
+        "_start",
+        "_started",
+        "_speed",
+        "_status",
+        "_retries",
+        "_attempts",
+        "_reached",
+        "_bytes_total",
+        "_bytes_downloaded",
+        "_offset",
+        "_ranges",
+        "_validator",
+        "_has_part",
+        "_stream_request",
+        "_stream_client",
+        "_unpaused",
+        "_aio",
+        "_task",
+    )
+
     def __init__(
         self,
         url: str,
@@ -47,106 +481,446 @@ class Download:
         retries: int = 3,
         client: "aiodown.Client" = None,
         workers: int = 8,
+        chunk_size: int = CHUNK_SIZE,
+        buffer_size: int = BUFFER_SIZE,
+        direct_io: bool = False,
+        low_speed_limit: int = 0,
+        low_speed_time: float = 30.0,
+        io_backend: str = "stdlib",
+        httpx_client: httpx.AsyncClient = None,
     ):
+        if io_backend not in _IO_BACKENDS:
+            raise ValueError(f"Unknown io_backend '{io_backend}'")
+        if io_backend == "caio" and importlib.util.find_spec("caio") is None:
+            raise ImportError("io_backend='caio' requires caio, install aiodown[caio]")
+
         self._client = client
         self._workers = workers
-
-        self._id = random.randint(1, 9999)
+        self._chunk_size = chunk_size
+        self._buffer_size = buffer_size
+        self._direct_io = direct_io
+        self._low_speed_limit = low_speed_limit
+        self._low_speed_time = low_speed_time
+        self._io_backend = io_backend
+        self._httpx_client = httpx_client
+
+        self._id = next(_ids)
         self._url = url
-        self._path = os.path.dirname(path) if path else None
-        self._name = os.path.basename(path) if path else os.path.basename(url)
+        self._path, self._name = (
+            os.path.split(path) if path else (None, os.path.basename(url))
+        )
         self._start = 0
-        self._status = "ready"
+        self._started = 0.0
+        self._speed = (0.0, 0.0)
+        self._status = _Status.READY
         self._retries = retries
         self._attempts = 0
+        self._reached = 0
         self._bytes_total = 0
         self._bytes_downloaded = 0
 
-        self._loop = asyncio.get_event_loop()
-        self._task = asyncio.ensure_future(self._request())
+        self._offset = 0
+        self._ranges = []
+        self._validator = None
+        self._has_part = False
+        self._stream_request = None
+        self._stream_client = None
+        self._unpaused = None
+        self._aio = None
+        self._task = None
 
     async def _request(self):
         """This is where the magic happens, everything is downloaded here.
 
-        Raises:
-            FileExistsError: In case the download location already exists.
+        The download fails if its location already exists or can not be created.
         """
 
-        if self.get_status() in ["reconnecting", "started"]:
-            if not self._path:
-                self._path = f"./downloads/{random.randint(1000, 9999)}"
-
-            if not os.path.exists(self._path):
-                os.makedirs(self._path)
+        # It may have been paused before the task got to run.
+        if self._status not in (_Status.STARTED, _Status.PAUSED):
+            return
 
-            path = os.path.join(self._path, self._name)
-            if not self.get_status() == "reconnecting":
-                if os.path.exists(path):
-                    raise FileExistsError(f"[Errno 17] File exists: '{path}'")
-                self._status = "downloading"
+        if not self._path:
+            self._path = f"./downloads/{uuid.uuid4().hex[:8]}"
 
-            try:
-                async with httpx.AsyncClient(
-                    http2=True, follow_redirects=True
-                ) as client:
-                    async with client.stream("GET", self._url) as response:
-                        assert response.status_code == 200
-
-                        self._bytes_total = int(response.headers["Content-Length"])
-
-                        async with async_files.FileIO(path, "wb") as file:
-                            async for chunk in response.aiter_bytes():
-                                if self.get_status() == "stopped":
-                                    break
-                                if self.get_status() == "paused":
-                                    while self.get_status() == "paused":
-                                        await asyncio.sleep(0.1)
-                                        continue
-
-                                bytes_downloaded = response.num_bytes_downloaded
-                                if self.get_status() == "reconnecting":
-                                    if bytes_downloaded < self.get_size_downloaded():
-                                        continue
-                                    else:
-                                        self._attempts = 0
-                                        self._status = "downloading"
-
-                                if bytes_downloaded > 0:
-                                    await file.write(chunk)
-                                    self._bytes_downloaded = bytes_downloaded
-
-                            if not self.get_status() == "stopped":
-                                self._status = "finished"
-                                log.info(f"{self.get_file_name()} finished!")
-                                if self._client is not None:
-                                    self._client.check_is_running()
-                            await file.close()
-                    await client.aclose()
-            except (
-                AssertionError,
-                httpx.CloseError,
-                httpcore.ConnectError,
-                httpx.ConnectError,
-                httpx.RemoteProtocolError,
-                KeyError,
-            ):
-                log.info(f"{self.get_file_name()} connection failed!")
-                self._status = "reconnecting"
-                log.info(f"{self.get_file_name()} retrying!")
-                if self.get_attempts() < self.get_retries():
+        try:
+            # The filesystem lookups may block, so they run in the default executor once.
+            path = await asyncio.get_running_loop().run_in_executor(
+                None, _prepare_path, self._path, self._name
+            )
+        except OSError:
+            # Nothing retrieves the result of the task, so the error is only logged.
+            self._finish(_Status.FAILED)
+            log.info("%s failed!", self._name, exc_info=True)
+            return
+        # The data is written next to the file and moved in place once complete,
+        # a stopped or failed download continues from it when started again.
+        part = path + ".part"
+        if self._status == _Status.STARTED:
+            self._status = _Status.DOWNLOADING
+
+        async with self._get_httpx() as (client, ranges_client), self._open_aio():
+            while True:
+                try:
+                    # A paused download does not take a slot until it is resumed.
+                    await self._unpaused.wait()
+                    async with self._get_slot():
+                        # Only the missing part of the file is requested again.
+                        resume = bool(self._ranges or self._offset)
+                        if not resume:
+                            self._validator = None
+                            self._ranges = await self._get_ranges(ranges_client)
+                        fd, direct_io = _open_file(
+                            part, self._direct_io, not self._has_part, not resume
+                        )
+                        self._has_part = True
+                        sync = False
+                        try:
+                            if self._ranges:
+                                await self._download_ranges(
+                                    ranges_client, fd, direct_io
+                                )
+                            else:
+                                await self._download_stream(client, fd, direct_io)
+                            sync = self._status != _Status.STOPPED
+                        finally:
+                            # Closing may block while the data is flushed, on network
+                            # filesystems for example, so it runs in the default executor.
+                            await asyncio.get_running_loop().run_in_executor(
+                                None, _close_file, fd, sync
+                            )
+
+                        if self._status != _Status.STOPPED:
+                            await _run_in_executor(os.replace, part, path)
+                            self._finish(_Status.FINISHED)
+                            log.info("%s finished!", self._name)
+                except (
+                    AssertionError,
+                    httpx.CloseError,
+                    httpcore.ConnectError,
+                    httpx.ConnectError,
+                    httpx.RemoteProtocolError,
+                    httpx.TimeoutException,
+                    _LowSpeedError,
+                    _ChangedError,
+                ):
+                    log.info("%s connection failed!", self._name)
+                    if self.is_finished():
+                        break
+
+                    if self._status != _Status.PAUSED:
+                        self._status = _Status.RECONNECTING
+                    if self._attempts >= self._retries:
+                        self._finish(_Status.FAILED)
+                        log.info(
+                            "%s reached the limit of %d attempts!",
+                            self._name,
+                            self.get_retries(),
+                        )
+                        break
+
+                    log.info("%s retrying!", self._name)
                     await asyncio.sleep(3)
                     self._attempts += 1
-                    await self._request()
+                    self._reached = max(self._reached, self._bytes_downloaded)
+                except asyncio.CancelledError:
+                    # The status belongs to a newer run if the download was started again.
+                    if self._task is asyncio.current_task():
+                        self._finish(_Status.STOPPED)
+                    raise
+                except Exception:
+                    self._finish(_Status.FAILED)
+                    log.info("%s failed!", self._name, exc_info=True)
+                    break
                 else:
-                    self._status = "failed"
-                    log.info(
-                        f"{self.get_file_name()} reached the limit of {self.get_retries()} attempts!"
-                    )
-            except BaseException:
-                self._status = "failed"
-                log.info(f"{self.get_file_name()} failed!")
-                if self._client is not None:
-                    self._client.check_is_running()
+                    break
+
+    async def _download_stream(
+        self, client: httpx.AsyncClient, fd: int, direct_io: bool
+    ):
+        """Downloads the file with a single request, from where the last attempt stopped."""
+
+        if direct_io:
+            # O_DIRECT writes must start at a block boundary.
+            self._offset -= self._offset % _BLOCK_SIZE
+
+        request = self._get_stream_request(client)
+        request.headers.pop("Range", None)
+        request.headers.pop("If-Range", None)
+        if self._offset:
+            request.headers["Range"] = f"bytes={self._offset}-"
+            if self._validator:
+                # The server sends the whole file if it has changed since then.
+                request.headers["If-Range"] = self._validator
+        async with _send(client, request) as response:
+            assert response.status_code in [200, 206]
+
+            if response.status_code == 200:
+                if self._offset:
+                    # The server does not support ranges or the file changed, start over.
+                    self._offset = 0
+                    os.ftruncate(fd, 0)
+                self._validator = _get_validator(response.headers)
+
+            # Chunked responses do not tell the size, it stays 0 until the end.
+            length = int(response.headers.get("Content-Length") or 0)
+            self._bytes_total = self._offset + length if length else 0
+            if (
+                length
+                and response.headers.get("Content-Encoding", "identity") == "identity"
+            ):
+                await _run_in_executor(_preallocate, fd, self._bytes_total)
+            if self._status == _Status.RECONNECTING:
+                self._status = _Status.DOWNLOADING
+
+            offset = self._offset
+            writer = self._get_writer(fd, offset, direct_io)
+
+            def on_progress(size: int):
+                # The size of the encoded data, which Content-Length refers to.
+                self._bytes_downloaded = offset + response.num_bytes_downloaded
+
+            try:
+                await self._copy_body(response, writer, on_progress)
+            finally:
+                # Decoded data can not be resumed with a range of the encoded one.
+                encoding = response.headers.get("Content-Encoding", "identity")
+                self._offset = writer.tell() if encoding == "identity" else 0
+
+            if not length and self._status != _Status.STOPPED:
+                self._bytes_total = self._bytes_downloaded
+            if direct_io:
+                os.ftruncate(fd, writer.tell())
+
+    def _iter_body(self, response: httpx.Response) -> AsyncIterator[bytes]:
+        """Iterates the body of the response.
+
+        Uncompressed data is passed on as it is received, since re-chunking it would
+        only copy it once more before the file writer buffers it. ``chunk_size``
+        applies to the decoded data of compressed responses.
+        """
+
+        if response.headers.get("Content-Encoding", "identity") == "identity":
+            return response.aiter_raw()
+        return response.aiter_bytes(self._chunk_size)
+
+    def _get_stream_request(self, client: httpx.AsyncClient) -> httpx.Request:
+        """Get the request of the single-stream download, built once and reused by the retries."""
+
+        if self._stream_client is not client:
+            self._stream_request = client.build_request("GET", self._url)
+            self._stream_client = client
+        return self._stream_request
+
+    async def _get_ranges(self, client: httpx.AsyncClient) -> List[List[int]]:
+        """Splits the file in byte ranges to be downloaded in parallel by the workers.
+
+        Returns:
+            List of ``list``: The next and last byte of each range, updated as the
+            range is written, empty if the server does not support ranges or the
+            file is too small to be split.
+        """
+
+        if self._workers < 2 or not hasattr(os, "pwrite"):
+            return []
+
+        response = await client.head(self._url)
+        total = int(response.headers.get("Content-Length", 0))
+        if (
+            response.status_code != 200
+            # Only an httpx client given by the user may speak HTTP/2 here, the
+            # ranges would share one connection and only add requests.
+            or response.http_version == "HTTP/2"
+            or response.headers.get("Accept-Ranges") != "bytes"
+            or response.headers.get("Content-Encoding", "identity") != "identity"
+        ):
+            return []
+
+        size = max(-(-total // self._workers), _MIN_RANGE_SIZE)
+        size = -(-size // _BLOCK_SIZE) * _BLOCK_SIZE
+        if size >= total:
+            return []
+
+        self._bytes_total = total
+        self._validator = _get_validator(response.headers)
+        return [
+            [start, min(start + size, total) - 1] for start in range(0, total, size)
+        ]
+
+    async def _download_ranges(
+        self,
+        client: httpx.AsyncClient,
+        fd: int,
+        direct_io: bool,
+    ):
+        """Downloads the missing part of each range with its own request, all at the same time."""
+
+        if direct_io:
+            # Each range is resumed from the start of its block, as in _download_stream.
+            for _range in self._ranges:
+                _range[0] -= _range[0] % _BLOCK_SIZE
+
+        await _run_in_executor(_preallocate, fd, self._bytes_total)
+        self._bytes_downloaded = self._bytes_total - sum(
+            end - start + 1 for start, end in self._ranges
+        )
+        tasks = [
+            asyncio.ensure_future(self._download_range(client, fd, direct_io, _range))
+            for _range in self._ranges
+            if _range[0] <= _range[1]
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # The writes of the other ranges must end before the file is closed.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        if direct_io:
+            os.ftruncate(fd, self._bytes_total)
+
+    async def _download_range(
+        self,
+        client: httpx.AsyncClient,
+        fd: int,
+        direct_io: bool,
+        _range: List[int],
+    ):
+        """Downloads a range of bytes to its place in the file, moving the start of the
+        range forward as the data is written."""
+
+        start, end = _range
+        headers = {"Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"}
+        if self._validator:
+            headers["If-Range"] = self._validator
+        async with client.stream("GET", self._url, headers=headers) as response:
+            if response.status_code == 200:
+                # The parts already downloaded belong to another version of the file.
+                self._ranges = []
+                raise _ChangedError(f"{self._url} changed during the download")
+            assert response.status_code == 206
+
+            if self._status == _Status.RECONNECTING:
+                self._status = _Status.DOWNLOADING
+
+            def on_progress(size: int):
+                self._bytes_downloaded += size
+
+            writer = self._get_writer(fd, start, direct_io)
+            try:
+                await self._copy_body(response, writer, on_progress)
+            finally:
+                _range[0] = writer.tell()
+
+    async def _copy_body(
+        self,
+        response: httpx.Response,
+        writer: "_FileWriter",
+        on_progress: Callable[[int], None],
+    ):
+        """Writes the body of the response to the file until it ends or the download
+        is stopped, waiting while the download is paused.
+
+        Parameters:
+            on_progress (``Callable``):
+                Called with the number of bytes received since its last call,
+                every 32 chunks and once the copy ends.
+        """
+
+        def report(size: int):
+            on_progress(size)
+            # Only a retry that gets further than the previous attempts is making
+            # progress, one that starts over and fails at the same place is not.
+            if self._attempts and self._bytes_downloaded > self._reached:
+                self._attempts = 0
+
+        speed = _SpeedCheck(self._low_speed_limit, self._low_speed_time)
+        chunks = received = 0
+        # Bound once instead of being looked up for every chunk.
+        write, update = writer.write, speed.update
+        stopped, paused = _Status.STOPPED, _Status.PAUSED
+        try:
+            async with writer:
+                async for chunk in self._iter_body(response):
+                    status = self._status
+                    if status == stopped:
+                        break
+                    if status == paused:
+                        await self._unpaused.wait()
+                        speed.reset()
+
+                    size = len(chunk)
+                    update(size)
+                    await write(chunk)
+                    received += size
+                    chunks += 1
+                    if not chunks & 31:
+                        report(received)
+                        received = 0
+        finally:
+            report(received)
+
+    def _get_writer(self, fd: int, offset: int, direct_io: bool) -> "_FileWriter":
+        """Get a writer for the file from the given offset, with the chosen I/O backend."""
+
+        # O_DIRECT needs the aligned buffer of the writer, which caio would copy.
+        aio = None if direct_io else self._aio
+        return _FileWriter(fd, offset, self._buffer_size, direct_io, aio)
+
+    def _finish(self, status: int):
+        """Sets a final status and notifies the parent client, only once per run."""
+
+        if self.is_finished():
+            return
+
+        self._status = status
+        if self._client is not None:
+            self._client._notify_finished()
+
+    @contextlib.asynccontextmanager
+    async def _get_slot(self):
+        """Waits for a free download slot in the parent client, if any."""
+
+        if self._client is None:
+            yield
+        else:
+            async with self._client._get_semaphore():
+                yield
+
+    @contextlib.asynccontextmanager
+    async def _get_httpx(
+        self,
+    ) -> AsyncIterator[Tuple[httpx.AsyncClient, httpx.AsyncClient]]:
+        """Get the httpx clients of the file and of its byte ranges, the one given to
+        the download or those shared by the parent client, otherwise default ones
+        that are closed when the run ends."""
+
+        if self._httpx_client is not None:
+            yield self._httpx_client, self._httpx_client
+        elif self._client is not None and self._client._httpx is not None:
+            yield self._client._httpx, self._client._httpx_ranges
+        else:
+            async with _make_httpx() as client:
+                async with _make_httpx(http2=False) as ranges_client:
+                    yield client, ranges_client
+
+    @contextlib.asynccontextmanager
+    async def _open_aio(self):
+        """Opens the caio context used by the writers of the run, if it is the chosen
+        I/O backend, and closes it when the run ends."""
+
+        if self._io_backend != "caio":
+            yield
+            return
+
+        import caio
+
+        async with caio.AsyncioContext(max_requests=_AIO_REQUESTS) as self._aio:
+            try:
+                yield
+            finally:
+                self._aio = None
 
     async def start(self):
         """Starts the download if it has not already been.
@@ -156,39 +930,72 @@ class Download:
             :obj:`aiodown.errors.ProgressError`: If the download is in progress.
         """
 
-        if self.get_status() == "started":
+        if self._status == _Status.STARTED:
             raise RuntimeError("Download is already started")
-        if not self.is_finished():
+        if self._status != _Status.READY and not self.is_finished():
             raise ProgressError()
 
-        self._status = "started"
+        if self._status == _Status.FINISHED:
+            # Only a stopped or failed download continues from its .part file,
+            # the state of a finished one describes a file that was moved in place.
+            self._offset = 0
+            self._ranges = []
+            self._validator = None
+            self._has_part = False
+            self._bytes_total = 0
+            self._bytes_downloaded = 0
+
+        self._status = _Status.STARTED
+        self._attempts = 0
+        self._reached = 0
         self._start = datetime.datetime.now()
-        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers)
-        future = self._loop.run_in_executor(pool, self._task, self.get_id())
-        await asyncio.gather(future, return_exceptions=True)
+        self._started = time.monotonic()
+        self._speed = (0.0, 0.0)
+        # Created here and not in __init__, it must belong to the running loop.
+        self._unpaused = asyncio.Event()
+        self._unpaused.set()
+        self._task = asyncio.get_running_loop().create_task(self._request())
+        if self._client is not None:
+            self._client._notify_started()
+
+        log.info("%s started!", self._name)
+
+    async def wait(self) -> "Download":
+        """Waits until the download has finished, failed or been stopped.
+
+        Returns:
+            :obj:`aiodown.types.Download`: The download object itself.
+        """
 
-        log.info(f"{self.get_file_name()} started!")
+        if self._task is not None:
+            # Unlike gather(), wait() does not cancel the task if the waiter is
+            # cancelled, a timeout while waiting must not stop the download.
+            await asyncio.wait([self._task])
+
+        return self
 
     async def stop(self):
-        """Stop download if started.
+        """Stop download if started, waiting until it has let go of the file.
 
         Raises:
             :obj:`aiodown.errors.FinishedError`: In case the download has already been completed.
-            RuntimeError: If the download has already stopped.
+            RuntimeError: If the download has already stopped or has not started.
         """
 
+        if self._status == _Status.STOPPED:
+            raise RuntimeError("Download is already stopped")
         if self.is_finished():
             raise FinishedError()
-        if self.get_status() == "stopped":
-            raise RuntimeError("Download is already stopped")
+        if self._status == _Status.READY:
+            raise RuntimeError("Download is not started")
 
-        self._status = "stopped"
-        if not self._task.cancelled():
+        self._finish(_Status.STOPPED)
+        if not self._task.done():
             self._task.cancel()
-        if self._client is not None:
-            self._client.check_is_running()
+        # The task may still be closing the file, which a new run would open again.
+        await asyncio.wait([self._task])
 
-        log.info(f"{self.get_file_name()} stopped!")
+        log.info("%s stopped!", self._name)
 
     async def pause(self):
         """Pauses the download if it is in progress.
@@ -196,16 +1003,20 @@ class Download:
         Raises:
             :obj:`aiodown.errors.FinishedError`: In case the download has already been completed.
             :obj:`aiodown.errors.PausedError`: In case the download is already paused.
+            RuntimeError: If the download has not started.
         """
 
         if self.is_finished():
             raise FinishedError()
-        if self.get_status() == "paused":
+        if self._status == _Status.PAUSED:
             raise PausedError()
+        if self._status == _Status.READY:
+            raise RuntimeError("Download is not started")
 
-        self._status = "paused"
+        self._status = _Status.PAUSED
+        self._unpaused.clear()
 
-        log.info(f"{self.get_file_name()} paused!")
+        log.info("%s paused!", self._name)
 
     async def resume(self):
         """Resume download if paused.
@@ -217,12 +1028,13 @@ class Download:
 
         if self.is_finished():
             raise FinishedError()
-        if self.get_status() != "paused":
+        if self._status != _Status.PAUSED:
             raise ProgressError()
 
-        self._status = "downloading"
+        self._status = _Status.DOWNLOADING
+        self._unpaused.set()
 
-        log.info(f"{self.get_file_name()} resumed!")
+        log.info("%s resumed!", self._name)
 
     def get_size_total(
         self, human: bool = False, binary: bool = False, gnu: bool = False
@@ -297,13 +1109,9 @@ class Download:
             ``float``: The current progress of the download.
         """
 
-        try:
-            progress = float(
-                f"{self.get_size_downloaded() / self.get_size_total() * 100:.1f}"
-            )
-        except ZeroDivisionError:
-            progress = 0
-        return progress
+        if not self._bytes_total:
+            return 0.0
+        return round(self._bytes_downloaded * 100 / self._bytes_total, 1)
 
     def get_id(self) -> int:
         """Get the download id.
@@ -330,7 +1138,7 @@ class Download:
             ``str``: The download status.
         """
 
-        return self._status
+        return _STATUS_NAMES[self._status]
 
     def get_retries(self) -> int:
         """Get the download retries.
@@ -371,9 +1179,7 @@ class Download:
     def get_start_time(
         self, human: bool = False, precise: bool = False
     ) -> Union[int, str]:
-        time = self._start
-
-        return self._human_precise(precise, human, time)
+        return self._human_precise(precise, human, self._start)
 
     def get_elapsed_time(
         self, human: bool = False, precise: bool = False
@@ -398,9 +1204,10 @@ class Download:
             ``str``: If human mode is enabled.
         """
 
-        time = datetime.datetime.now() - self.get_start_time()
+        seconds = time.monotonic() - self._started if self._started else 0
+        elapsed = datetime.timedelta(seconds=seconds)
 
-        return self._human_precise(precise, human, time)
+        return self._human_precise(precise, human, elapsed)
 
     def get_speed(
         self, human: bool = False, binary: bool = False, gnu: bool = False
@@ -431,11 +1238,18 @@ class Download:
             ``str``: If human mode is enabled.
         """
 
-        speed = self.get_size_downloaded() / (
-            (datetime.datetime.now() - self._start).seconds + 1
-        )
+        return self._human_binary(binary, gnu, human, self._get_speed())
 
-        return self._human_binary(binary, gnu, human, speed)
+    def _get_speed(self) -> float:
+        """Get the average speed in bytes per second, reused for 100 ms so that
+        progress bars polling many times per second do not recompute it."""
+
+        now = time.monotonic()
+        when, speed = self._speed
+        if now - when >= 0.1:
+            speed = self._bytes_downloaded / max(now - self._started, 1e-3)
+            self._speed = (now, speed)
+        return speed
 
     def _human_binary(self, binary, gnu, human, arg3):
         if (binary or gnu) and not human:
@@ -448,7 +1262,7 @@ class Download:
             )
 
         if human:
-            return humanize.naturalsize(arg3, binary=binary, gnu=gnu)
+            return _naturalsize(arg3, binary, gnu)
         return arg3
 
     def get_eta(self, human: bool = False, precise: bool = False) -> Union[int, str]:
@@ -472,20 +1286,21 @@ class Download:
             ``str``: If human mode is enabled.
         """
 
-        try:
-            time = datetime.timedelta(
-                seconds=(self.get_size_total() - self.get_size_downloaded())
-                / self.get_speed()
-            )
-        except ZeroDivisionError:
-            time = datetime.timedelta(seconds=0)
+        speed = self._get_speed()
+        remaining = self._bytes_total - self._bytes_downloaded
+        remaining = remaining / speed if speed and remaining > 0 else 0
 
-        return self._human_precise(precise, human, time)
+        return self._human_precise(
+            precise, human, datetime.timedelta(seconds=remaining)
+        )
 
     def _human_precise(self, precise, human, time):
         if precise and not human:
             raise TypeError("To get accurate time, activate human mode")
         if human:
+            # Imported on first use, most calls do not ask for a human format.
+            import humanize
+
             if precise:
                 return humanize.precisedelta(time)
             else:
@@ -499,7 +1314,12 @@ class Download:
             ``bool``: True if the download has been finished.
         """
 
-        return self.get_status() in ["failed", "finished", "ready", "stopped"]
+        return self._status in _FINISHED_STATUSES
+
+    def _is_running(self) -> bool:
+        """Checks whether the download has started and not ended yet."""
+
+        return self._status != _Status.READY and not self.is_finished()
 
     def is_success(self) -> bool:
         """Checks whether the download was successful.
@@ -514,7 +1334,7 @@ class Download:
         if not self.is_finished():
             raise ProgressError()
 
-        return self.get_status == "finished"
+        return self._status == _Status.FINISHED
 
     def __repr__(self) -> str:
         """Get some download details.
@@ -523,9 +1343,12 @@ class Download:
             ``str``: Some download details.
         """
 
-        return f"{self.__class__.__name__}(id={self.get_id()}, url={self.get_url()}, path={self.get_file_path()}, name={self.get_file_name()}, status={self.get_status()})"
+        return (
+            f"{type(self).__name__}(id={self._id}, url={self._url}, path={self._path}, "
+            f"name={self._name}, status={_STATUS_NAMES[self._status]})"
+        )
 
-    def __str__(self) -> Callable:
+    def __str__(self) -> str:
         """Get some download details.
 
         Returns:
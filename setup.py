@@ -14,10 +14,13 @@ setup(
     version="1.0.7",
     packages=find_packages(),
     install_requires=[
-        "async-files >= 0.4",
-        "httpx[http2] >= 0.20",
+        "httpx[http2] >= 0.25",
         "humanize >= 3.2.0",
     ],
+    extras_require={
+        "uvloop": ["uvloop >= 0.14; sys_platform != 'win32'"],
+        "caio": ["caio >= 0.9; sys_platform == 'linux'"],
+    },
     url="https://github.com/AmanoTeam/aiodown",
     python_requires=">=3.8",
     author="AmanoTeam",
@@ -0,0 +1,101 @@
+"""A small HTTP server to download a random file from, in a background thread.
+
+The query string of the link changes how the file is served:
+
+* ``norange``: byte ranges are not supported.
+* ``slow``: the body is sent in small pieces with a pause between them.
+* ``drop``: the connection is always closed halfway through the body.
+* ``chunked``: the body is sent chunked, without ``Content-Length``.
+"""
+
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DATA = os.urandom(3 * 1048576 + 12345)
+ETAG = '"v1"'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._send(head=True)
+
+    def do_GET(self):
+        self._send()
+
+    def _send(self, head: bool = False):
+        chunked = "chunked" in self.path
+        ranges = "norange" not in self.path and not chunked
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if self.headers.get("If-Range", ETAG) != ETAG:
+            match = None
+
+        if ranges and match:
+            start = int(match.group(1))
+            end = int(match.group(2) or len(DATA) - 1)
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = DATA[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        else:
+            body = DATA
+            self.send_response(200)
+        if ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", ETAG)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if head:
+            return
+
+        try:
+            if chunked:
+                for i in range(0, len(body), 65536):
+                    chunk = body[i : i + 65536]
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            if "drop" in self.path:
+                self.wfile.write(body[: len(body) // 2])
+                self.close_connection = True
+                return
+            step = 65536 if "slow" in self.path else len(body) or 1
+            for i in range(0, len(body), step):
+                self.wfile.write(body[i : i + step])
+                if "slow" in self.path:
+                    time.sleep(0.02)
+        except ConnectionError:
+            # The download was stopped.
+            self.close_connection = True
+
+
+class Server:
+    """Serves :data:`DATA` on a free port of localhost until it is closed."""
+
+    def __init__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, query: str = "") -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/file.bin" + (f"?{query}" if query else "")
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,223 @@
+import asyncio
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+from aiodown import Client
+from aiodown.types import Download
+from aiodown.types.download import _aio_write
+
+from server import DATA, Server
+
+
+class DownloadTestCase(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "file.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertDownloaded(self, dl: Download):
+        self.assertEqual(dl.get_status(), "finished")
+        self.assertFalse(os.path.exists(self.path + ".part"))
+        with open(self.path, "rb") as file:
+            self.assertTrue(file.read() == DATA, "the file differs from the served one")
+
+    async def test_ranges(self):
+        dl = Download(self.server.url(), self.path, workers=8)
+        await dl.start()
+        await dl.wait()
+
+        self.assertDownloaded(dl)
+        self.assertEqual(dl.get_size_total(), len(DATA))
+        self.assertEqual(dl.get_size_downloaded(), len(DATA))
+
+    async def test_stream(self):
+        dl = Download(self.server.url("norange"), self.path, workers=8)
+        await dl.start()
+        await dl.wait()
+
+        self.assertDownloaded(dl)
+        self.assertEqual(dl.get_size_total(), len(DATA))
+
+    async def test_chunked(self):
+        dl = Download(self.server.url("chunked"), self.path, workers=8)
+        await dl.start()
+        await dl.wait()
+
+        self.assertDownloaded(dl)
+        self.assertEqual(dl.get_size_total(), len(DATA))
+        self.assertEqual(dl.get_size_downloaded(), len(DATA))
+
+    async def test_direct_io(self):
+        for query in ("", "norange"):
+            with self.subTest(query=query):
+                dl = Download(self.server.url(query), self.path, direct_io=True)
+                await dl.start()
+                await dl.wait()
+                self.assertDownloaded(dl)
+                os.remove(self.path)
+
+    @unittest.skipIf(importlib.util.find_spec("caio") is None, "caio is not installed")
+    async def test_caio(self):
+        for query in ("", "norange"):
+            with self.subTest(query=query):
+                dl = Download(self.server.url(query), self.path, io_backend="caio")
+                await dl.start()
+                await dl.wait()
+                self.assertDownloaded(dl)
+                os.remove(self.path)
+
+    async def test_aio_partial_writes(self):
+        class Context:
+            """Writes at most 1000 bytes at once, like a kernel may do."""
+
+            async def write(self, data, fd, offset):
+                return os.pwrite(fd, data[:1000], offset)
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT)
+        try:
+            await _aio_write(Context(), fd, DATA[:12345], 100)
+        finally:
+            os.close(fd)
+        with open(self.path, "rb") as file:
+            self.assertEqual(file.read(), bytes(100) + DATA[:12345])
+
+    async def test_stop_and_restart(self):
+        for query in ("slow", "slow&norange"):
+            with self.subTest(query=query):
+                dl = Download(self.server.url(query), self.path, workers=8)
+                await dl.start()
+                await asyncio.sleep(0.1)
+                await dl.stop()
+                self.assertEqual(dl.get_status(), "stopped")
+
+                await dl.start()
+                await dl.wait()
+                self.assertDownloaded(dl)
+                os.remove(self.path)
+
+    async def test_pause_after_start(self):
+        dl = Download(self.server.url("slow"), self.path, workers=8)
+        await dl.start()
+        await dl.pause()
+        await asyncio.sleep(0.1)
+        self.assertEqual(dl.get_status(), "paused")
+
+        await dl.resume()
+        await dl.wait()
+        self.assertDownloaded(dl)
+
+    async def test_restart_after_finish(self):
+        for query in ("", "norange"):
+            with self.subTest(query=query):
+                dl = Download(self.server.url(query), self.path, workers=8)
+                await dl.start()
+                await dl.wait()
+                self.assertDownloaded(dl)
+                os.remove(self.path)
+
+                await dl.start()
+                await dl.wait()
+                self.assertDownloaded(dl)
+                os.remove(self.path)
+
+    async def test_retry_limit(self):
+        dl = Download(self.server.url("drop&norange"), self.path, retries=1)
+        await dl.start()
+        await asyncio.wait_for(dl.wait(), 10)
+
+        self.assertEqual(dl.get_status(), "failed")
+        self.assertEqual(dl.get_attempts(), 1)
+
+    async def test_file_exists(self):
+        open(self.path, "wb").close()
+        dl = Download(self.server.url(), self.path)
+        await dl.start()
+        await dl.wait()
+
+        self.assertEqual(dl.get_status(), "failed")
+        # Nothing retrieves it, it would be logged as never retrieved.
+        self.assertIsNone(dl._task.exception())
+
+    async def test_wait_timeout(self):
+        dl = Download(self.server.url("slow"), self.path, workers=8)
+        await dl.start()
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(dl.wait(), 0.1)
+
+        await dl.wait()
+        self.assertDownloaded(dl)
+
+    async def test_client(self):
+        async with Client(max_downloads=2) as client:
+            for name in ("a", "b", "c"):
+                client.add(self.server.url(), os.path.join(self.directory, name))
+            await client.start()
+            downloads = [dl async for dl in client.iter_completed()]
+
+        self.assertEqual([dl.get_status() for dl in downloads], ["finished"] * 3)
+        self.assertFalse(client.is_running())
+
+    async def test_client_restart(self):
+        async with Client() as client:
+            first = client.add(self.server.url("slow&norange"), self.path)
+            second = client.add(self.server.url(), os.path.join(self.directory, "b"))
+            await client.start()
+            await first.stop()
+            await first.start()
+
+            await second.wait()
+            self.assertTrue(client.is_running())
+            await first.wait()
+            self.assertFalse(client.is_running())
+            self.assertDownloaded(first)
+
+    async def test_client_empty(self):
+        client = Client()
+        await client.start()
+        self.assertFalse(client.is_running())
+
+
+class ClientTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def test_event_loops(self):
+        """A client can be started again from another event loop."""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        client = Client(max_downloads=1)
+
+        async def run(name: str):
+            async with client:
+                client.clear()
+                for index in range(3):
+                    path = os.path.join(directory, f"{name}{index}")
+                    client.add(self.server.url(), path)
+                await client.start()
+                return [(await dl.wait()).get_status() for dl in client.get_downloads()]
+
+        self.assertEqual(asyncio.run(run("first")), ["finished"] * 3)
+        self.assertEqual(asyncio.run(run("second")), ["finished"] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()